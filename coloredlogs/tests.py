@@ -1,7 +1,7 @@
 # Automated tests for the `coloredlogs' package.
 #
 # Author: Peter Odding <peter@peterodding.com>
-# Last Change: November 1, 2016
+# Last Change: October 15, 2026
 # URL: https://coloredlogs.readthedocs.io
 
 """Automated tests for the `coloredlogs` package."""
@@ -12,10 +12,13 @@ import logging.handlers
 import os
 import random
 import re
+import shutil
+import socket
 import string
 import subprocess
 import sys
 import tempfile
+import time
 import unittest
 
 # External dependencies.
@@ -41,7 +44,14 @@ from coloredlogs import (
     set_level,
     walk_propagation_tree,
 )
-from coloredlogs.syslog import SystemLogging
+from coloredlogs.syslog import (
+    DEFAULT_LOG_FORMAT,
+    SystemLogFormatter,
+    SystemLogging,
+    connect_to_syslog,
+    enable_system_logging,
+    send_datagrams,
+)
 from coloredlogs.converter import capture, convert
 
 # External test dependencies.
@@ -133,6 +143,315 @@ class ColoredLogsTestCase(unittest.TestCase):
                 with open('/var/log/syslog') as handle:
                     assert any(expected_message in line for line in handle)
 
+    def test_system_logging_buffer(self):
+        """Make sure :func:`~coloredlogs.syslog.connect_to_syslog()` can buffer log messages."""
+        with LogDevice() as device:
+            handler = connect_to_syslog(address=device.pathname, buffer_capacity=3)
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            # Make sure log messages are buffered until the capacity is reached.
+            logger.info("first")
+            logger.info("second")
+            assert device.receive() == []
+            logger.info("third")
+            messages = device.receive()
+            assert len(messages) == 3
+            assert all(m.startswith(b'<14>') for m in messages)
+            assert messages[-1].endswith(b'third\x00')
+            # Make sure errors are sent immediately.
+            logger.info("fourth")
+            logger.error("fifth")
+            assert len(device.receive()) == 2
+            # Make sure buffered messages are sent when the handler is closed.
+            logger.info("sixth")
+            handler.close()
+            assert len(device.receive()) == 1
+            # Make sure buffered messages are sent after the flush interval.
+            handler = connect_to_syslog(address=device.pathname, buffer_capacity=10, flush_interval=0.1)
+            logger.handlers = [handler]
+            logger.info("seventh")
+            assert device.receive() == []
+            time.sleep(0.5)
+            assert len(device.receive()) == 1
+            # Make sure errors in the flush timer are reported using handleError().
+            errors = []
+            handler.handleError = errors.append
+            device.socket.close()
+            os.unlink(device.pathname)
+            logger.info("eighth")
+            time.sleep(0.5)
+            assert len(errors) == 1
+            assert errors[0].getMessage() == \
+                "Failed to send 1 buffered log message(s) to the system logging daemon!"
+            handler.close()
+
+    def test_system_logging_queue(self):
+        """Make sure :func:`~coloredlogs.syslog.enable_system_logging()` can use a background thread."""
+        with LogDevice() as device:
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.DEBUG)
+            with SystemLogging(programname='coloredlogs-test-suite', logger=logger,
+                               async_queue=True, address=device.pathname, level=logging.INFO) as handler:
+                assert isinstance(handler, logging.handlers.QueueHandler)
+                assert handler.listener is not None
+                # Records below the level of the system logging handler
+                # shouldn't be queued at all.
+                assert handler.level == logging.INFO
+                logger.debug("ignored message")
+                logger.info("queued message")
+            # Leaving the context stops the background thread after it has
+            # processed the queued log records.
+            assert handler.listener is None
+            messages = device.receive()
+            assert len(messages) == 1
+            expected = 'coloredlogs-test-suite[%i]: INFO queued message' % os.getpid()
+            assert expected.encode('UTF-8') in messages[0]
+            # Queue handlers created by other code (e.g. dictConfig() since
+            # Python 3.12) shouldn't be replaced, even if they feed a system
+            # logging handler.
+            import queue
+            stream = StringIO()
+            records = queue.Queue()
+            listener = logging.handlers.QueueListener(
+                records, logging.StreamHandler(stream),
+                logging.handlers.SysLogHandler(address=device.pathname),
+            )
+            foreign_handler = logging.handlers.QueueHandler(records)
+            foreign_handler.listener = listener
+            listener.start()
+            try:
+                logger.handlers = [foreign_handler]
+                with SystemLogging(logger=logger, address=device.pathname):
+                    assert foreign_handler in logger.handlers
+                    assert foreign_handler.listener is listener
+                    logger.info("console message")
+            finally:
+                listener.stop()
+            assert "console message" in stream.getvalue()
+
+    def test_system_logging_reconfigure(self):
+        """Make sure reconfiguring system logging reuses the existing connection."""
+        with LogDevice() as device:
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            first_handler = enable_system_logging(programname='first', logger=logger, address=device.pathname)
+            second_handler = enable_system_logging(programname='second', logger=logger, address=device.pathname)
+            # The connection is reused but the handler isn't.
+            assert second_handler is not first_handler
+            assert second_handler.socket is not None
+            assert first_handler.socket is None
+            assert logger.handlers == [second_handler]
+            logger.warning("reconfigured")
+            messages = device.receive()
+            assert len(messages) == 1
+            assert b'second[' in messages[0]
+            # The old handler no longer sends anything (nor creates a new socket).
+            errors = []
+            first_handler.handleError = errors.append
+            first_handler.emit(logging.makeLogRecord(dict(msg="orphaned")))
+            assert len(errors) == 1
+            assert first_handler.socket is None
+            assert device.receive() == []
+            # Changing the connection options creates a new handler.
+            third_handler = enable_system_logging(logger=logger, address=device.pathname, buffer_capacity=10)
+            assert third_handler is not second_handler
+            assert logger.handlers == [third_handler]
+            # Failing to flush buffered log messages doesn't break reconfiguration.
+            errors = []
+            third_handler.handleError = errors.append
+            logger.warning("buffered")
+            device.socket.close()
+            os.unlink(device.pathname)
+            fourth_handler = enable_system_logging(logger=logger, address=device.pathname, buffer_capacity=10)
+            assert logger.handlers == [fourth_handler]
+            assert len(errors) == 1
+
+    def test_system_logging_timeout(self):
+        """Make sure log messages aren't silently lost when the socket has a timeout."""
+        default_timeout = socket.getdefaulttimeout()
+        socket.setdefaulttimeout(0.2)
+        try:
+            with LogDevice() as device:
+                handler = connect_to_syslog(address=device.pathname, buffer_capacity=1000)
+                errors = []
+                handler.handleError = errors.append
+                logger = logging.getLogger(random_string())
+                logger.propagate = False
+                logger.setLevel(logging.INFO)
+                logger.addHandler(handler)
+                # Flood the log device until its receive queue is full.
+                for i in range(1000):
+                    logger.info("message %i", i)
+                assert len(errors) == 1
+                handler.close()
+        finally:
+            socket.setdefaulttimeout(default_timeout)
+
+    def test_system_logging_overflow(self):
+        """Make sure log messages are dropped when the system logging daemon isn't keeping up."""
+        with LogDevice() as device:
+            handler = connect_to_syslog(address=device.pathname, on_overflow='drop')
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            # Flood the log device until its receive queue is full.
+            for i in range(10000):
+                logger.info("message %i", i)
+                if handler.dropped:
+                    break
+            assert handler.dropped == 1
+            logger.info("dropped")
+            assert handler.dropped == 2
+            # Make sure the dropped messages are reported.
+            device.receive()
+            logger.info("sent")
+            messages = device.receive()
+            assert len(messages) == 2
+            assert b'Dropped 2 log message(s)' in messages[0]
+            assert messages[1].endswith(b'sent\x00')
+            assert handler.dropped == 0
+
+    def test_system_logging_protocol(self):
+        """Make sure :func:`~coloredlogs.syslog.connect_to_syslog()` respects the `protocol` option."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            server.bind(('127.0.0.1', 0))
+            server.listen(1)
+            address = server.getsockname()
+            assert connect_to_syslog(address=address, protocol='tcp').socktype == socket.SOCK_STREAM
+            assert connect_to_syslog(address=address, protocol='udp').socktype == socket.SOCK_DGRAM
+            # UDP is preferred for network addresses.
+            assert connect_to_syslog(address=address).socktype == socket.SOCK_DGRAM
+            self.assertRaises(ValueError, connect_to_syslog, address=address, protocol='sctp')
+        finally:
+            server.close()
+        with LogDevice() as device:
+            # Datagram sockets are preferred for log devices.
+            assert connect_to_syslog(address=device.pathname).socktype == socket.SOCK_DGRAM
+            # Log devices that can't be connected to are reported.
+            assert connect_to_syslog(address=device.pathname + '.missing') is None
+
+    def test_system_logging_partial_send(self):
+        """Make sure log messages that were sent before an error aren't sent again."""
+        with LogDevice() as device:
+            handler = connect_to_syslog(address=device.pathname)
+            # The last datagram exceeds the maximum datagram size.
+            messages = [b'first', b'second', b'x' * 1024 * 1024 * 4]
+            try:
+                send_datagrams(handler.socket, messages)
+                assert False, "Expected send_datagrams() to raise an exception!"
+            except socket.error as e:
+                assert e.datagrams_sent == 2
+            assert device.receive() == [b'first', b'second']
+            # Make sure transmit() only retries the messages that weren't sent.
+            self.assertRaises(socket.error, handler.transmit, messages)
+            assert device.receive() == [b'first', b'second']
+            handler.close()
+
+    def test_system_logging_udp(self):
+        """Make sure UDP sockets are connected to the system logging daemon."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            server.bind(('127.0.0.1', 0))
+            server.settimeout(5)
+            handler = connect_to_syslog(address=server.getsockname(), protocol='udp', buffer_capacity=2)
+            assert handler.connected
+            errors = []
+            handler.handleError = errors.append
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            logger.addHandler(handler)
+            logger.info("first")
+            logger.info("second")
+            assert server.recv(1024).endswith(b'first\x00')
+            assert server.recv(1024).endswith(b'second\x00')
+            # Make sure rejected datagrams are ignored like they are on
+            # unconnected UDP sockets.
+            server.close()
+            for i in range(4):
+                logger.info("rejected")
+            assert not errors
+        finally:
+            server.close()
+
+    def test_system_logging_formatter(self):
+        """Make sure :class:`~coloredlogs.syslog.SystemLogFormatter` matches the default log format."""
+        regular_formatter = logging.Formatter(DEFAULT_LOG_FORMAT)
+        optimized_formatter = SystemLogFormatter('coloredlogs-test-suite')
+        try:
+            raise ValueError("Testing, 1, 2, 3 ..")
+        except ValueError:
+            exc_info = sys.exc_info()
+        for kw in dict(), dict(exc_info=exc_info):
+            record = logging.makeLogRecord(dict(
+                levelno=logging.INFO, levelname='INFO',
+                msg="Hello %s!", args=('world',), **kw
+            ))
+            record.programname = 'coloredlogs-test-suite'
+            assert optimized_formatter.format(record) == regular_formatter.format(record)
+
+    def test_system_logging_custom_format(self):
+        """Make sure the program name is embedded in custom log formats."""
+        with LogDevice() as device:
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            handler = enable_system_logging(programname='test%suite', logger=logger, address=device.pathname,
+                                            fmt='%(programname)s: 100%% %(message)s')
+            assert not handler.filters
+            logger.info("custom format")
+            assert device.receive()[0].endswith(b'test%suite: 100% custom format\x00')
+            # Conversions other than `s' still require the filter.
+            handler = enable_system_logging(programname='test', logger=logger, address=device.pathname,
+                                            fmt='%(programname)10s %(message)s')
+            assert handler.filters
+            logger.info("custom format")
+            assert device.receive()[0].endswith(b'      test custom format\x00')
+
+    def test_system_logging_flush_on_exit(self):
+        """Make sure buffered log messages aren't lost when system logging is disabled or reconfigured."""
+        with LogDevice() as device:
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            for async_queue in False, True:
+                with SystemLogging(logger=logger, address=device.pathname,
+                                   async_queue=async_queue, buffer_capacity=10):
+                    logger.info("buffered message")
+                    assert device.receive() == []
+                messages = device.receive()
+                assert len(messages) == 1
+                assert messages[0].endswith(b'buffered message\x00')
+            # Reconfiguring with different options closes the existing handler.
+            enable_system_logging(logger=logger, address=device.pathname, buffer_capacity=10)
+            logger.info("buffered message")
+            assert device.receive() == []
+            enable_system_logging(logger=logger, address=device.pathname, buffer_capacity=20)
+            messages = device.receive()
+            assert len(messages) == 1
+            assert messages[0].endswith(b'buffered message\x00')
+
+    def test_system_logging_reconfigure_context(self):
+        """Make sure leaving a context doesn't disable a newer configuration."""
+        with LogDevice() as device:
+            logger = logging.getLogger(random_string())
+            logger.propagate = False
+            logger.setLevel(logging.INFO)
+            context = SystemLogging(logger=logger, address=device.pathname)
+            context.__enter__()
+            handler = enable_system_logging(logger=logger, address=device.pathname)
+            context.__exit__()
+            assert logger.handlers == [handler]
+            logger.info("still enabled")
+            messages = device.receive()
+            assert len(messages) == 1
+            assert messages[0].endswith(b'still enabled\x00')
+
     def test_name_normalization(self):
         """Make sure :class:`~coloredlogs.NameNormalizer` works as intended."""
         nn = NameNormalizer()
@@ -356,6 +675,37 @@ def main(*arguments, **options):
         sys.stdout = saved_stdout
 
 
+class LogDevice(object):
+
+    """Fake log device that captures the messages sent to it."""
+
+    def __init__(self):
+        """Initialize a :class:`LogDevice` object."""
+        self.directory = tempfile.mkdtemp()
+        self.pathname = os.path.join(self.directory, 'log')
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+
+    def __enter__(self):
+        """Bind the UNIX socket."""
+        self.socket.bind(self.pathname)
+        self.socket.setblocking(False)
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, traceback=None):
+        """Close the UNIX socket and clean up the temporary directory."""
+        self.socket.close()
+        shutil.rmtree(self.directory)
+
+    def receive(self):
+        """Get the messages that were received since the last call."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.socket.recv(1024 * 64))
+            except socket.error:
+                return messages
+
+
 def random_string(length=25):
     """Generate a random string."""
     return ''.join(random.choice(string.ascii_letters) for i in range(25))